@@ -0,0 +1,7 @@
+# Gunicorn settings for production: `gunicorn server:app`
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2))
+worker_class = "uvicorn.workers.UvicornWorker"
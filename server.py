@@ -1,34 +1,119 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import ORJSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.errors import BulkWriteError
+import redis.asyncio as redis
 import os
+import asyncio
+import threading
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Dict, List, Optional
 import uuid
-from datetime import datetime, timezone
+import time
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import msgspec
+import orjson
+from cachetools import TTLCache
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# MongoDB connection pool usage, reported by /api/health. PyMongo fires these
+# callbacks from Motor's executor threads, so updates are serialized with a lock.
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.checkout_failures = 0
+
+    def connection_created(self, event):
+        with self.lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.open -= 1
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.in_use += 1
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.in_use -= 1
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.checkout_failures += 1
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+pool_stats = PoolStats()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', 200)),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', 20)),
+    maxIdleTimeMS=60000,
+    waitQueueTimeoutMS=5000,
+    tz_aware=True,
+    event_listeners=[pool_stats]
+)
 db = client[os.environ['DB_NAME']]
+HEALTH_PING_TIMEOUT = 2  # seconds
+
+# Optional Redis cache for chat history, shared by all workers
+redis_url = os.environ.get('REDIS_URL')
+redis_client = redis.from_url(redis_url) if redis_url else None
+HISTORY_CACHE_TTL = 300  # seconds
+HISTORY_GENERATION_TTL = 24 * 3600  # seconds; must outlive any cached body
+
+# Chat messages older than this are removed by a MongoDB TTL index
+CHAT_RETENTION_DAYS = 90
+
+# Chat messages are queued by generate_reply() and inserted in batches by
+# write_chat_messages(), trading a short durability window for fewer round trips
+CHAT_WRITE_INTERVAL = 0.05  # seconds
+CHAT_WRITE_BATCH_SIZE = 500
+CHAT_WRITE_RETRIES = 5
+CHAT_WRITE_RETRY_DELAY = 0.2  # seconds, doubled on each retry
+CHAT_WRITE_CONCURRENCY = 4  # batches flushed at once, so one retrying batch does not stall the rest
+CHAT_WRITE_QUEUE_SIZE = 10000  # generate_reply() waits for room once this many messages are queued
+chat_write_queue: Optional[asyncio.Queue] = None
+chat_writer_task: Optional[asyncio.Task] = None
+# Messages queued or being flushed, by session_id then id, so replies still see them as history
+pending_chat_messages: Dict[str, Dict[str, dict]] = {}
 
 # LLM API Key
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+LLM_PROVIDER = "gemini"
+LLM_MODEL = "gemini-3-flash-preview"
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Tax Assistant System Message
+# Kept static; per-request data (history, the user's question) goes in the user message.
 TAX_ASSISTANT_SYSTEM_MESSAGE = """You are MyCA AI Tax Assistant, an expert Chartered Accountant specializing in Indian taxation. You provide professional advice on:
 
 1. **Income Tax Returns (ITR)**: Filing guidance, tax slabs, deductions under 80C, 80D, HRA exemptions, capital gains
@@ -44,16 +129,57 @@ Guidelines:
 - Be helpful, professional, and explain concepts clearly
 - Use examples with INR amounts when helpful"""
 
+# CA services offered; static, so the /services payload is encoded once at import
+SERVICES = [
+    {
+        "id": "itr",
+        "title": "ITR Filing",
+        "description": "Expert income tax return filing for individuals and businesses",
+        "price": "Starting ₹999",
+        "features": ["All ITR forms", "Tax optimization", "Quick processing", "Expert review"]
+    },
+    {
+        "id": "gst",
+        "title": "GST Returns",
+        "description": "Complete GST compliance - GSTR-1, 3B, Annual returns",
+        "price": "Starting ₹1,499/month",
+        "features": ["GSTR-1 & GSTR-3B", "Input credit reconciliation", "E-invoicing setup", "Compliance calendar"]
+    },
+    {
+        "id": "tax-planning",
+        "title": "Tax Planning",
+        "description": "Strategic tax planning to maximize your savings legally",
+        "price": "Starting ₹2,999",
+        "features": ["Investment advice", "Deduction optimization", "Future planning", "Tax projections"]
+    },
+    {
+        "id": "business",
+        "title": "Business Services",
+        "description": "Complete accounting and compliance for businesses",
+        "price": "Custom pricing",
+        "features": ["Company registration", "TDS returns", "Audit support", "Advisory services"]
+    }
+]
+SERVICES_JSON = orjson.dumps({"services": SERVICES})
+
+def uuid7() -> uuid.UUID:
+    """Time-ordered UUID (RFC 9562 version 7): 48-bit Unix ms timestamp followed by random bits"""
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | 0x7 << 76  # version 7
+    value = value & ~(0x3 << 62) | 0x2 << 62  # RFC 4122 variant
+    return uuid.UUID(int=value)
+
 # Models
 class ChatMessage(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: str(uuid7()))
     session_id: str
     role: str  # 'user' or 'assistant'
     content: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-class ChatRequest(BaseModel):
+# Hot-path request bodies are msgspec Structs, decoded by decode_body()
+class ChatRequest(msgspec.Struct):
     session_id: str
     message: str
 
@@ -63,7 +189,7 @@ class ChatResponse(BaseModel):
 
 class ContactForm(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: str(uuid7()))
     name: str
     email: EmailStr
     phone: str
@@ -78,7 +204,7 @@ class ContactFormCreate(BaseModel):
     service: str
     message: str
 
-class TaxCalculationRequest(BaseModel):
+class TaxCalculationRequest(msgspec.Struct):
     income: float
     deductions_80c: float = 0
     deductions_80d: float = 0
@@ -98,14 +224,58 @@ class TaxCalculationResponse(BaseModel):
 
 class DocumentUpload(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: str(uuid7()))
     filename: str
     file_type: str
     purpose: str
     user_email: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Assistant replies to context-free questions, keyed by question_cache_key()
+response_cache = TTLCache(maxsize=1024, ttl=3600)
+
 # Helper functions
+def body_error(msg: str, error_type: str = "value_error", loc: Optional[list] = None) -> HTTPException:
+    """422 in FastAPI's request-validation shape: detail is a list of {loc, msg, type}"""
+    return HTTPException(status_code=422, detail=[{"loc": ["body"] + (loc or []), "msg": msg, "type": error_type}])
+
+def decode_body(body: bytes, body_type):
+    """Parse and validate a JSON request body in one pass"""
+    try:
+        # strict=False keeps accepting numeric strings, as Pydantic's lax mode did
+        return msgspec.json.decode(body, type=body_type, strict=False)
+    except msgspec.ValidationError as e:
+        # msgspec reports the location as a "- at `$.field[0]`" suffix
+        msg, _, path = str(e).partition(" - at `$")
+        loc = [int(index) if index else field for field, index in re.findall(r"\.(\w+)|\[(\d+)\]", path)]
+        missing = re.match(r"Object missing required field `(\w+)`", msg)
+        if missing:
+            raise body_error("Field required", "missing", loc + [missing.group(1)])
+        raise body_error(msg, "value_error", loc)
+    except msgspec.DecodeError as e:
+        raise body_error(str(e), "json_invalid")
+
+def question_cache_key(message: str) -> str:
+    """Hash a question after normalizing case, whitespace and trailing punctuation"""
+    normalized = " ".join(message.lower().split()).rstrip("?.! ")
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+# Tax slabs FY 2024-25: lower edge, marginal rate and tax accrued below each edge
+OLD_REGIME_EDGES = np.array([0, 250000, 500000, 1000000])
+OLD_REGIME_RATES = np.array([0, 0.05, 0.20, 0.30])
+OLD_REGIME_BASES = np.array([0, 0, 12500, 112500])
+
+NEW_REGIME_EDGES = np.array([0, 300000, 700000, 1000000, 1200000, 1500000])
+NEW_REGIME_RATES = np.array([0, 0.05, 0.10, 0.15, 0.20, 0.30])
+NEW_REGIME_BASES = np.array([0, 0, 20000, 50000, 80000, 140000])
+
+MAX_TAX_BATCH_SIZE = 100
+
+def slab_tax(taxable_income, edges, rates, bases):
+    """Apply a slab table to an array of incomes; negative incomes fall in the first (nil) slab"""
+    idx = np.maximum(np.searchsorted(edges, taxable_income, side="right") - 1, 0)
+    return bases[idx] + (taxable_income - edges[idx]) * rates[idx]
+
 def calculate_tax_old_regime(taxable_income: float) -> float:
     """Calculate tax under old regime FY 2024-25"""
     if taxable_income <= 250000:
@@ -132,62 +302,237 @@ def calculate_tax_new_regime(taxable_income: float) -> float:
     else:
         return 20000 + 30000 + 30000 + 60000 + (taxable_income - 1500000) * 0.30
 
-# API Routes
-@api_router.get("/")
-async def root():
-    return {"message": "MyCA API - Tax Assistant Service"}
+def calculate_taxes(requests: List[TaxCalculationRequest]) -> List[TaxCalculationResponse]:
+    """Calculate income tax for a batch of requests in one vectorized pass (used by /calculate-tax/batch)"""
+    income = np.array([r.income for r in requests], dtype=float)
+    old = np.array([r.regime == "old" for r in requests], dtype=bool)
+    
+    # Old regime allows deductions; new regime gets the standard deduction of 75000 only
+    old_deductions = np.minimum([r.deductions_80c for r in requests], 150000) + \
+                     np.minimum([r.deductions_80d for r in requests], 75000) + \
+                     np.array([r.hra_exemption for r in requests], dtype=float) + \
+                     np.array([r.other_deductions for r in requests], dtype=float)
+    total_deductions = np.where(old, old_deductions, 75000)
+    taxable_income = np.maximum(0, income - total_deductions)
+    tax_amount = np.where(
+        old,
+        slab_tax(taxable_income, OLD_REGIME_EDGES, OLD_REGIME_RATES, OLD_REGIME_BASES),
+        slab_tax(taxable_income, NEW_REGIME_EDGES, NEW_REGIME_RATES, NEW_REGIME_BASES)
+    )
+    
+    # Rebate u/s 87A for income up to 7 lakhs (new regime)
+    tax_amount = np.where(~old & (taxable_income <= 700000), 0, tax_amount)
+    
+    cess = tax_amount * 0.04
+    total_tax = tax_amount + cess
+    effective_rate = np.divide(total_tax * 100, income, out=np.zeros_like(income), where=income > 0)
+    
+    return [
+        TaxCalculationResponse(
+            gross_income=r.income,
+            total_deductions=float(total_deductions[i]),
+            taxable_income=float(taxable_income[i]),
+            tax_amount=float(tax_amount[i]),
+            cess=float(cess[i]),
+            total_tax=float(total_tax[i]),
+            effective_rate=round(float(effective_rate[i]), 2),
+            regime=r.regime
+        )
+        for i, r in enumerate(requests)
+    ]
 
-@api_router.post("/chat", response_model=ChatResponse)
-async def chat_with_assistant(request: ChatRequest):
-    """Chat with the AI Tax Assistant"""
+# Cached history is stored per generation; invalidating bumps the generation, so
+# a fill that read MongoDB before the bump lands under a key no reader uses again
+def history_generation_key(session_id: str) -> str:
+    return f"hist-gen:{session_id}"
+
+def history_cache_key(session_id: str, generation: int) -> str:
+    return f"hist:{session_id}:{generation}"
+
+async def invalidate_history_cache(session_id: str):
+    """Start a new cache generation for a session after its messages change"""
+    if redis_client is None:
+        return
     try:
-        # Initialize LLM chat
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(history_generation_key(session_id))
+            pipe.expire(history_generation_key(session_id), HISTORY_GENERATION_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logging.error(f"History cache error: {str(e)}")
+
+async def flush_chat_messages(docs: List[dict]):
+    """Insert a batch of chat messages, retrying with backoff, and invalidate the affected history caches"""
+    session_ids = {doc["session_id"] for doc in docs}
+    pending = docs
+    for attempt in range(CHAT_WRITE_RETRIES + 1):
+        try:
+            await db.chat_messages.insert_many(pending, ordered=False)
+            pending = []
+            break
+        except BulkWriteError as e:
+            # Unordered insert: only the listed documents failed; duplicate keys were written by an earlier attempt
+            pending = [pending[err["index"]] for err in e.details["writeErrors"] if err["code"] != 11000]
+            error = e
+        except Exception as e:
+            error = e
+        if not pending:
+            break
+        if attempt < CHAT_WRITE_RETRIES:
+            logging.warning(f"Chat write error, retrying {len(pending)} messages: {str(error)}")
+            await asyncio.sleep(CHAT_WRITE_RETRY_DELAY * 2 ** attempt)
+    if pending:
+        lost_sessions = sorted({doc["session_id"] for doc in pending})
+        logging.error(
+            f"Chat write failed after {CHAT_WRITE_RETRIES} retries, dropped {len(pending)} messages "
+            f"for sessions {lost_sessions}: {str(error)}"
+        )
+    for doc in docs:
+        session_pending = pending_chat_messages.get(doc["session_id"], {})
+        session_pending.pop(doc["id"], None)
+        if not session_pending:
+            pending_chat_messages.pop(doc["session_id"], None)
+    await asyncio.gather(*(invalidate_history_cache(sid) for sid in session_ids))
+
+async def write_chat_messages():
+    """Drain chat_write_queue in batches until the None sentinel arrives"""
+    flush_slots = asyncio.Semaphore(CHAT_WRITE_CONCURRENCY)
+    flushes = set()
+
+    async def flush(docs: List[dict]):
+        try:
+            await flush_chat_messages(docs)
+        finally:
+            flush_slots.release()
+
+    while True:
+        batch = [await chat_write_queue.get()]
+        if batch[0] is not None:
+            await asyncio.sleep(CHAT_WRITE_INTERVAL)  # let concurrent requests join the batch
+        while batch[-1] is not None and len(batch) < CHAT_WRITE_BATCH_SIZE and not chat_write_queue.empty():
+            batch.append(chat_write_queue.get_nowait())
+        docs = [doc for doc in batch if doc is not None]
+        if docs:
+            await flush_slots.acquire()
+            task = asyncio.create_task(flush(docs))
+            flushes.add(task)
+            task.add_done_callback(flushes.discard)
+        if batch[-1] is None:
+            await asyncio.gather(*flushes)
+            return
+
+def log_chat_writer_exit(task: asyncio.Task):
+    """Surface a chat writer that stopped other than through the shutdown sentinel"""
+    if task.cancelled():
+        logging.error("Chat writer was cancelled; chat messages are no longer saved")
+    elif task.exception() is not None:
+        logging.error(f"Chat writer crashed; chat messages are no longer saved: {str(task.exception())}")
+
+async def generate_reply(request: ChatRequest) -> str:
+    """Answer a chat message with the AI Tax Assistant and persist the exchange"""
+    if chat_writer_task.done():
+        raise RuntimeError("Chat writer is not running; messages cannot be saved")
+    
+    # Get chat history for context
+    history = await db.chat_messages.find(
+        {"session_id": request.session_id},
+        {"_id": 0, "id": 1, "role": 1, "content": 1}
+    ).sort("timestamp", -1).limit(10).to_list(10)
+    history.reverse()  # Last 10 messages for context, oldest first
+    
+    # Messages still waiting in the write queue are newer than anything MongoDB returned
+    queued = pending_chat_messages.get(request.session_id)
+    if queued:
+        saved_ids = {msg.get("id") for msg in history}
+        history += sorted(
+            (doc for doc in queued.values() if doc["id"] not in saved_ids),
+            key=lambda doc: doc["timestamp"]
+        )
+        history = history[-10:]
+    
+    # Build context from history
+    context_messages = []
+    for msg in history:
+        context_messages.append(f"{msg['role'].upper()}: {msg['content']}")
+    
+    # Create message with context
+    full_message = request.message
+    if context_messages:
+        full_message = f"Previous conversation:\n" + "\n".join(context_messages) + f"\n\nUser's new question: {request.message}"
+    
+    user_msg = ChatMessage(
+        session_id=request.session_id,
+        role="user",
+        content=request.message
+    )
+    
+    # Reuse a recent answer for the same opening question, else ask the LLM
+    cache_key = question_cache_key(request.message) if not history else None
+    response = response_cache.get(cache_key) if cache_key else None
+    if response is None:
         chat = LlmChat(
             api_key=EMERGENT_LLM_KEY,
             session_id=request.session_id,
             system_message=TAX_ASSISTANT_SYSTEM_MESSAGE
-        ).with_model("gemini", "gemini-3-flash-preview")
-        
-        # Get chat history for context
-        history = await db.chat_messages.find(
-            {"session_id": request.session_id},
-            {"_id": 0}
-        ).sort("timestamp", 1).to_list(20)
-        
-        # Build context from history
-        context_messages = []
-        for msg in history[-10:]:  # Last 10 messages for context
-            context_messages.append(f"{msg['role'].upper()}: {msg['content']}")
-        
-        # Create message with context
-        full_message = request.message
-        if context_messages:
-            full_message = f"Previous conversation:\n" + "\n".join(context_messages) + f"\n\nUser's new question: {request.message}"
-        
-        # Send message to LLM
+        ).with_model(LLM_PROVIDER, LLM_MODEL)
         user_message = UserMessage(text=full_message)
         response = await chat.send_message(user_message)
-        
-        # Save user message
-        user_msg = ChatMessage(
-            session_id=request.session_id,
-            role="user",
-            content=request.message
-        )
-        user_doc = user_msg.model_dump()
-        user_doc['timestamp'] = user_doc['timestamp'].isoformat()
-        await db.chat_messages.insert_one(user_doc)
-        
-        # Save assistant response
-        assistant_msg = ChatMessage(
-            session_id=request.session_id,
-            role="assistant",
-            content=response
-        )
-        assistant_doc = assistant_msg.model_dump()
-        assistant_doc['timestamp'] = assistant_doc['timestamp'].isoformat()
-        await db.chat_messages.insert_one(assistant_doc)
-        
+        if cache_key:
+            response_cache[cache_key] = response
+    
+    assistant_msg = ChatMessage(
+        session_id=request.session_id,
+        role="assistant",
+        content=response,
+        # BSON dates keep milliseconds only; keep a cached reply sorted after the question
+        timestamp=max(datetime.now(timezone.utc), user_msg.timestamp + timedelta(milliseconds=1))
+    )
+    
+    # Save both messages through the batched background writer
+    for doc in (user_msg.model_dump(), assistant_msg.model_dump()):
+        pending_chat_messages.setdefault(request.session_id, {})[doc["id"]] = doc
+        await chat_write_queue.put(doc)
+    
+    return response
+
+# API Routes
+@api_router.get("/")
+async def root():
+    return {"message": "MyCA API - Tax Assistant Service"}
+
+@api_router.get("/health")
+async def health():
+    """Report MongoDB reachability and connection pool usage"""
+    try:
+        # Bounded so an unreachable server reports quickly instead of waiting out server selection
+        await asyncio.wait_for(client.admin.command("ping"), timeout=HEALTH_PING_TIMEOUT)
+        status = "ok"
+    except asyncio.TimeoutError:
+        logging.error("Health check error: MongoDB ping timed out")
+        status = "unavailable"
+    except Exception as e:
+        logging.error(f"Health check error: {str(e)}")
+        status = "unavailable"
+    # Server addresses are deliberately omitted; this endpoint is public
+    with pool_stats.lock:
+        pool = {
+            "max_size": client.options.pool_options.max_pool_size,
+            "open": pool_stats.open,
+            "in_use": pool_stats.in_use,
+            "checkout_failures": pool_stats.checkout_failures
+        }
+    return {
+        "status": status,
+        "topology": client.topology_description.topology_type_name,
+        "pool": pool
+    }
+
+@api_router.post("/chat", response_model=ChatResponse)
+async def chat_with_assistant(raw: Request):
+    """Chat with the AI Tax Assistant"""
+    request = decode_body(await raw.body(), ChatRequest)
+    try:
+        response = await generate_reply(request)
         return ChatResponse(response=response, session_id=request.session_id)
         
     except Exception as e:
@@ -197,33 +542,54 @@ async def chat_with_assistant(request: ChatRequest):
 @api_router.get("/chat/history/{session_id}")
 async def get_chat_history(session_id: str):
     """Get chat history for a session"""
+    cache_key = None
+    if redis_client is not None:
+        try:
+            # Read the generation before MongoDB so a concurrent invalidation orphans this fill
+            generation = int(await redis_client.get(history_generation_key(session_id)) or 0)
+            cache_key = history_cache_key(session_id, generation)
+            cached = await redis_client.get(cache_key)
+            if cached is not None:
+                return Response(content=cached, media_type="application/json")
+        except Exception as e:
+            logging.error(f"History cache error: {str(e)}")
+    
     messages = await db.chat_messages.find(
         {"session_id": session_id},
-        {"_id": 0}
+        {"_id": 0, "id": 1, "role": 1, "content": 1, "timestamp": 1}
     ).sort("timestamp", 1).to_list(100)
-    return {"messages": messages}
+    response = ORJSONResponse({"messages": messages})
+    
+    if cache_key is not None:
+        try:
+            await redis_client.set(cache_key, response.body, ex=HISTORY_CACHE_TTL)
+        except Exception as e:
+            logging.error(f"History cache error: {str(e)}")
+    return response
 
 @api_router.delete("/chat/history/{session_id}")
 async def clear_chat_history(session_id: str):
     """Clear chat history for a session"""
     await db.chat_messages.delete_many({"session_id": session_id})
+    await invalidate_history_cache(session_id)
     return {"message": "Chat history cleared"}
 
 @api_router.post("/contact")
 async def submit_contact_form(form: ContactFormCreate):
     """Submit a contact/consultation request"""
     try:
-        contact = ContactForm(**form.model_dump())
+        # form is already validated; build the record without re-running validation
+        contact = ContactForm.model_construct(**form.model_dump())
         doc = contact.model_dump()
-        doc['timestamp'] = doc['timestamp'].isoformat()
         await db.contact_forms.insert_one(doc)
         return {"message": "Thank you! We'll contact you within 24 hours.", "id": contact.id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/calculate-tax", response_model=TaxCalculationResponse)
-async def calculate_tax(request: TaxCalculationRequest):
+async def calculate_tax(raw: Request):
     """Calculate income tax based on income and deductions"""
+    request = decode_body(await raw.body(), TaxCalculationRequest)
     total_deductions = 0
     
     if request.regime == "old":
@@ -259,6 +625,16 @@ async def calculate_tax(request: TaxCalculationRequest):
         regime=request.regime
     )
 
+@api_router.post("/calculate-tax/batch", response_model=List[TaxCalculationResponse])
+async def calculate_tax_batch(raw: Request):
+    """Calculate income tax for several scenarios at once, e.g. comparing regimes"""
+    requests = decode_body(await raw.body(), List[TaxCalculationRequest])
+    if len(requests) > MAX_TAX_BATCH_SIZE:
+        raise body_error(f"At most {MAX_TAX_BATCH_SIZE} scenarios per batch")
+    if not requests:
+        return []
+    return calculate_taxes(requests)
+
 @api_router.post("/upload-document")
 async def upload_document(
     file: UploadFile = File(...),
@@ -281,11 +657,9 @@ async def upload_document(
             user_email=user_email
         )
         doc_dict = doc_record.model_dump()
-        doc_dict['timestamp'] = doc_dict['timestamp'].isoformat()
         await db.documents.insert_one(doc_dict)
         
-        # Read file content (in production, save to cloud storage)
-        content = await file.read()
+        # File content is not read yet (in production, stream it to cloud storage in chunks)
         
         return {
             "message": "Document uploaded successfully! Our CA will review it within 24 hours.",
@@ -300,37 +674,11 @@ async def upload_document(
 @api_router.get("/services")
 async def get_services():
     """Get list of CA services offered"""
-    services = [
-        {
-            "id": "itr",
-            "title": "ITR Filing",
-            "description": "Expert income tax return filing for individuals and businesses",
-            "price": "Starting ₹999",
-            "features": ["All ITR forms", "Tax optimization", "Quick processing", "Expert review"]
-        },
-        {
-            "id": "gst",
-            "title": "GST Returns",
-            "description": "Complete GST compliance - GSTR-1, 3B, Annual returns",
-            "price": "Starting ₹1,499/month",
-            "features": ["GSTR-1 & GSTR-3B", "Input credit reconciliation", "E-invoicing setup", "Compliance calendar"]
-        },
-        {
-            "id": "tax-planning",
-            "title": "Tax Planning",
-            "description": "Strategic tax planning to maximize your savings legally",
-            "price": "Starting ₹2,999",
-            "features": ["Investment advice", "Deduction optimization", "Future planning", "Tax projections"]
-        },
-        {
-            "id": "business",
-            "title": "Business Services",
-            "description": "Complete accounting and compliance for businesses",
-            "price": "Custom pricing",
-            "features": ["Company registration", "TDS returns", "Audit support", "Advisory services"]
-        }
-    ]
-    return {"services": services}
+    return Response(
+        content=SERVICES_JSON,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
 
 # Include the router
 app.include_router(api_router)
@@ -350,6 +698,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    # session_id first (equality) so the timestamp sort is served by the index
+    await db.chat_messages.create_index([("session_id", 1), ("timestamp", 1)])
+    # Expire chat messages after the retention period to keep the working set small
+    await db.chat_messages.create_index("timestamp", expireAfterSeconds=CHAT_RETENTION_DAYS * 24 * 3600)
+    await db.contact_forms.create_index("email")
+    await db.documents.create_index("user_email")
+
+@app.on_event("startup")
+async def start_chat_writer():
+    global chat_write_queue, chat_writer_task
+    chat_write_queue = asyncio.Queue(maxsize=CHAT_WRITE_QUEUE_SIZE)
+    chat_writer_task = asyncio.create_task(write_chat_messages())
+    chat_writer_task.add_done_callback(log_chat_writer_exit)
+
+@app.on_event("shutdown")
+async def stop_chat_writer():
+    # Flush messages still queued before the database client closes
+    if chat_writer_task.done():
+        return  # already reported by log_chat_writer_exit()
+    await chat_write_queue.put(None)
+    await chat_writer_task
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    if redis_client is not None:
+        await redis_client.aclose()